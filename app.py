@@ -1,15 +1,21 @@
+import glob
 import os
+import re
+import stat
+import time
 import uuid
+from contextlib import asynccontextmanager
 from datetime import datetime
-from typing import List, Optional
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 
 from fastapi import FastAPI, File, UploadFile, Form, Request, HTTPException
-from fastapi.responses import FileResponse, JSONResponse, HTMLResponse
+from fastapi.responses import FileResponse, JSONResponse, HTMLResponse, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
 
-from models.higgs_audio import HiggsAudioModel, GenerationConfig
+from models.higgs_audio import HiggsAudioModel, GenerationConfig, VoiceSampleMissing
 
 
 # -----------------------------------------------------------------------------
@@ -27,7 +33,14 @@ os.makedirs(GENERATED_DIR, exist_ok=True)
 os.makedirs(MODELS_DIR, exist_ok=True)
 
 
-app = FastAPI(title="Voice AI Studio", docs_url=None, redoc_url=None)
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    """Stop the model's worker threads when the server exits."""
+    yield
+    voice_model.close()
+
+
+app = FastAPI(title="Voice AI Studio", docs_url=None, redoc_url=None, lifespan=lifespan)
 
 app.mount("/static", StaticFiles(directory=os.path.join(BASE_DIR, "static")), name="static")
 
@@ -60,6 +73,60 @@ class HistoryItem(BaseModel):
 # Utility functions
 # -----------------------------------------------------------------------------
 
+# Accepted voice sample formats
+ALLOWED_VOICE_EXTS = frozenset({".wav", ".mp3", ".flac", ".ogg"})
+
+# Largest voice sample accepted by /upload-voice
+MAX_UPLOAD_BYTES = 50 << 20
+
+# Bytes read from an upload per iteration when copying it to disk
+UPLOAD_CHUNK_SIZE = 1 << 20
+
+# File suffixes listed in the history (checked without lowercasing each name)
+HISTORY_EXTS = (".wav", ".WAV")
+
+# Seconds a cached history listing may be served before it is rebuilt
+HISTORY_CACHE_TTL = 30.0
+
+# limit -> (GENERATED_DIR mtime_ns, items, time cached)
+_history_cache: Dict[int, Tuple[int, List[HistoryItem], float]] = {}
+
+# Filename-unsafe characters in the text preview; "__" separates id and preview
+_PREVIEW_TABLE = str.maketrans({"\n": " ", "\r": " ", "/": "_", "\\": "_"})
+_PREVIEW_UNDERSCORES = re.compile(r"__+")
+
+# voice_id -> path of the uploaded sample in VOICE_INPUT_DIR
+VOICE_INDEX: Dict[str, str] = {}
+
+
+def _index_voice_inputs() -> None:
+    """
+    Populate VOICE_INDEX from samples already on disk (e.g. from a previous run).
+    Uploaded files are named <voice_id><ext>.
+    """
+    with os.scandir(VOICE_INPUT_DIR) as it:
+        for entry in it:
+            if entry.is_file():
+                voice_id = os.path.splitext(entry.name)[0]
+                VOICE_INDEX.setdefault(voice_id, entry.path)
+
+
+def resolve_voice_path(voice_id: str) -> Optional[str]:
+    """
+    Map a voice_id to its uploaded sample, falling back to a disk lookup for
+    files that were added outside of /upload-voice.
+    """
+    voice_path = VOICE_INDEX.get(voice_id)
+    if voice_path is None and os.path.basename(voice_id) == voice_id:
+        candidates = glob.glob(os.path.join(VOICE_INPUT_DIR, glob.escape(voice_id) + ".*"))
+        if candidates:
+            voice_path = VOICE_INDEX[voice_id] = candidates[0]
+    return voice_path
+
+
+_index_voice_inputs()
+
+
 def list_history(limit: int = 20) -> List[HistoryItem]:
     """
     Read files from the GENERATED_DIR and build a lightweight history list,
@@ -67,23 +134,38 @@ def list_history(limit: int = 20) -> List[HistoryItem]:
     """
     items: List[HistoryItem] = []
 
-    if not os.path.isdir(GENERATED_DIR):
+    try:
+        dir_stat = os.stat(GENERATED_DIR)
+    except OSError:
         return items
 
+    # Adding/removing a file bumps the directory mtime, so an unchanged mtime
+    # means the listing is still valid. The TTL covers filesystems with coarse
+    # timestamps and keeps stale entries from piling up.
+    now = time.monotonic()
+    for key, (_, _, cached_at) in list(_history_cache.items()):
+        if now - cached_at > HISTORY_CACHE_TTL:
+            del _history_cache[key]
+
+    cached = _history_cache.get(limit)
+    if cached is not None and cached[0] == dir_stat.st_mtime_ns:
+        return list(cached[1])
+
+    # Single scandir pass: DirEntry caches is_file()/stat() so each file
+    # costs one stat at most instead of isfile + getmtime twice. The name is
+    # checked first so non-audio entries cost no syscall at all.
+    with os.scandir(GENERATED_DIR) as it:
+        entries = [
+            (entry.name, entry.stat().st_mtime)
+            for entry in it
+            if entry.name.endswith(HISTORY_EXTS) and entry.is_file()
+        ]
+
     # Sort by modification time, newest first
-    files = sorted(
-        [
-            f
-            for f in os.listdir(GENERATED_DIR)
-            if os.path.isfile(os.path.join(GENERATED_DIR, f)) and f.lower().endswith(".wav")
-        ],
-        key=lambda name: os.path.getmtime(os.path.join(GENERATED_DIR, name)),
-        reverse=True,
-    )
+    entries.sort(key=lambda e: e[1], reverse=True)
 
-    for f in files[:limit]:
-        path = os.path.join(GENERATED_DIR, f)
-        ts = datetime.fromtimestamp(os.path.getmtime(path)).isoformat(timespec="seconds")
+    for f, mtime in entries[:limit]:
+        ts = datetime.fromtimestamp(mtime).isoformat(timespec="seconds")
         # Text preview is stored in filename metadata after a separator if present
         # Pattern: <uuid>__<preview>.wav
         base = os.path.splitext(f)[0]
@@ -100,7 +182,8 @@ def list_history(limit: int = 20) -> List[HistoryItem]:
             )
         )
 
-    return items
+    _history_cache[limit] = (dir_stat.st_mtime_ns, items, now)
+    return list(items)
 
 
 # -----------------------------------------------------------------------------
@@ -132,21 +215,57 @@ async def upload_voice(file: UploadFile = File(...)) -> JSONResponse:
         raise HTTPException(status_code=400, detail="No file uploaded.")
 
     ext = os.path.splitext(file.filename)[1].lower()
-    allowed_exts = {".wav", ".mp3", ".flac", ".ogg"}
-    if ext not in allowed_exts:
+    if ext not in ALLOWED_VOICE_EXTS:
         raise HTTPException(status_code=400, detail="Unsupported audio format.")
 
+    too_large = HTTPException(
+        status_code=413,
+        detail=f"Voice sample is too large (max {MAX_UPLOAD_BYTES >> 20} MB).",
+    )
+    if file.size is not None and file.size > MAX_UPLOAD_BYTES:
+        raise too_large
+
     voice_id = str(uuid.uuid4())
     dest_filename = f"{voice_id}{ext}"
     dest_path = os.path.join(VOICE_INPUT_DIR, dest_filename)
 
+    # Copy in fixed-size chunks so large uploads never sit in memory whole,
+    # and stop as soon as the size limit is crossed
+    total = 0
     with open(dest_path, "wb") as f:
-        content = await file.read()
-        f.write(content)
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            total += len(chunk)
+            if total > MAX_UPLOAD_BYTES:
+                break
+            await run_in_threadpool(f.write, chunk)
+
+    if total > MAX_UPLOAD_BYTES:
+        os.unlink(dest_path)
+        raise too_large
+
+    VOICE_INDEX[voice_id] = dest_path
 
     return JSONResponse({"voice_id": voice_id, "filename": dest_filename})
 
 
+@app.delete("/delete-voice/{voice_id}")
+async def delete_voice(voice_id: str) -> JSONResponse:
+    """
+    Remove an uploaded voice sample so it can no longer be used for generation.
+    """
+    voice_path = resolve_voice_path(voice_id)
+    if voice_path is None:
+        raise HTTPException(status_code=404, detail="Voice not found.")
+
+    VOICE_INDEX.pop(voice_id, None)
+    try:
+        os.unlink(voice_path)
+    except FileNotFoundError:
+        pass
+
+    return JSONResponse({"voice_id": voice_id, "deleted": True})
+
+
 @app.post("/generate")
 async def generate(
     text: str = Form(...),
@@ -170,14 +289,7 @@ async def generate(
 
     voice_path: Optional[str] = None
     if voice_id:
-        # Look for a file that starts with this voice_id
-        candidates = [
-            os.path.join(VOICE_INPUT_DIR, f)
-            for f in os.listdir(VOICE_INPUT_DIR)
-            if f.startswith(voice_id)
-        ]
-        if candidates:
-            voice_path = candidates[0]
+        voice_path = resolve_voice_path(voice_id)
 
     cfg = GenerationConfig(
         temperature=temperature,
@@ -186,21 +298,32 @@ async def generate(
         sample_rate=24000,
     )
 
-    # Use first 50 characters as text preview in the filename for history
-    preview = text.replace("\n", " ")[:50].strip()
-    preview = preview.replace("__", "_")
+    # Use first 50 characters as text preview in the filename for history.
+    # Only a bounded prefix is cleaned up, however long the text is.
+    preview = _PREVIEW_UNDERSCORES.sub("_", text[:256].translate(_PREVIEW_TABLE))[:50].strip()
 
     out_id = str(uuid.uuid4())
     filename = f"{out_id}__{preview}.wav" if preview else f"{out_id}.wav"
     output_path = os.path.join(GENERATED_DIR, filename)
 
     try:
-        await voice_model.generate_async(
-            text=text,
-            voice_sample_path=voice_path,
-            output_path=output_path,
-            config=cfg,
-        )
+        try:
+            await voice_model.generate_async(
+                text=text,
+                voice_sample_path=voice_path,
+                output_path=output_path,
+                config=cfg,
+            )
+        except VoiceSampleMissing:
+            # The sample was deleted, possibly through another worker process
+            # with its own VOICE_INDEX; forget it and generate without it
+            VOICE_INDEX.pop(voice_id, None)
+            await voice_model.generate_async(
+                text=text,
+                voice_sample_path=None,
+                output_path=output_path,
+                config=cfg,
+            )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Generation failed: {e}") from e
 
@@ -214,16 +337,37 @@ async def generate(
 
 
 @app.get("/download/{filename}")
-async def download(filename: str) -> FileResponse:
+async def download(filename: str, request: Request) -> Response:
     """
     Download a generated audio file from the outputs/audio folder.
     """
     safe_name = os.path.basename(filename)
     path = os.path.join(GENERATED_DIR, safe_name)
-    if not os.path.isfile(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        st = None
+    if st is None or not stat.S_ISREG(st.st_mode):
         raise HTTPException(status_code=404, detail="File not found.")
 
-    return FileResponse(path, media_type="audio/wav", filename=safe_name)
+    # Generated files are never rewritten, so size + mtime identify the content
+    etag = f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+    headers = {"Cache-Control": "public, max-age=3600", "ETag": etag}
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        if etag in tags or "*" in tags:
+            return Response(status_code=304, headers=headers)
+
+    # Hand the stat result over so FileResponse doesn't stat the file again
+    return FileResponse(
+        path,
+        media_type="audio/wav",
+        filename=safe_name,
+        stat_result=st,
+        headers=headers,
+    )
 
 
 @app.get("/history")
@@ -233,7 +377,7 @@ async def get_history() -> JSONResponse:
     This mirrors ComfyUI's "outputs" folder behavior, but via an API for the UI.
     """
     items = list_history(limit=20)
-    return JSONResponse({"items": [item.dict() for item in items]})
+    return JSONResponse({"items": [item.model_dump(mode="json") for item in items]})
 
 
 @app.get("/status")
@@ -248,6 +392,8 @@ async def status() -> JSONResponse:
 if __name__ == "__main__":
     import uvicorn
 
+    # uvicorn picks uvloop / httptools automatically when they are installed
+    # (uvicorn[standard]) and falls back to asyncio / h11 otherwise
     uvicorn.run("app:app", host="0.0.0.0", port=8000, reload=True)
 
 